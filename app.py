@@ -1,10 +1,9 @@
 import streamlit as st
 import os
-from qrcode import QRCode
-from qrcode.constants import ERROR_CORRECT_L
-from io import BytesIO
-import base64
-from web3 import Web3
+import re
+import html
+import requests
+from concurrent.futures import ThreadPoolExecutor
 
 st.set_page_config(
     page_title="Wallet Dashboard",
@@ -18,6 +17,13 @@ WALLET_USERNAME = os.environ.get("WALLET_USERNAME", "@hashyz")
 
 BSC_RPC_URL = "https://bsc-dataseed.binance.org/"
 USDT_CONTRACT_ADDRESS = "0x55d398326f99059fF775485246999027B3197955"
+USDT_DECIMALS = 18
+USDT_UNIT = 10 ** USDT_DECIMALS
+WEI_PER_BNB = 10 ** 18
+BALANCE_TTL_SECONDS = 30
+RPC_TIMEOUT_SECONDS = 10
+ADDRESS_PATTERN = re.compile(r"0x[0-9a-fA-F]{40}")
+RATE_LIMIT_ERROR_CODES = {-32005, 429}
 
 USDT_ABI = [
     {
@@ -26,17 +32,89 @@ USDT_ABI = [
         "name": "balanceOf",
         "outputs": [{"name": "balance", "type": "uint256"}],
         "type": "function"
-    },
-    {
-        "constant": True,
-        "inputs": [],
-        "name": "decimals",
-        "outputs": [{"name": "", "type": "uint8"}],
-        "type": "function"
     }
 ]
 
-st.markdown("""
+PORTFOLIO_CARD_TEMPLATE = """
+<div class="main-container">
+<div class="portfolio-card">
+<div class="username-badge">{username}</div>
+<div class="live-indicator"><span class="live-dot"></span>Live from BSC</div>
+<div class="portfolio-label">Total Portfolio Value</div>
+<div class="portfolio-value">${total_usd}</div>
+</div>
+</div>
+"""
+
+BALANCE_ROW_TEMPLATE = """
+<div class="main-container">
+<div class="balance-row">
+<div class="balance-card">
+<div class="balance-label">BNB BALANCE</div>
+<div class="balance-amount">{bnb_balance}</div>
+<div class="balance-token">BNB</div>
+</div>
+<div class="balance-card">
+<div class="balance-label">USDT BALANCE</div>
+<div class="balance-amount">${usdt_balance}</div>
+<div class="balance-token">USDT (BEP20)</div>
+</div>
+</div>
+</div>
+"""
+
+QR_SECTION_TEMPLATE = """
+<div class="main-container">
+<div class="qr-section">
+<div class="qr-title">Send to this wallet</div>
+<div class="qr-subtitle">Scan QR code or copy address below</div>
+<div class="qr-container">
+<img src="data:image/png;base64,{qr_code_base64}" width="180" height="180" alt="QR Code">
+</div>
+<div class="address-section">
+<div class="address-label">WALLET ADDRESS</div>
+<div class="address-text">{address}</div>
+</div>
+<div class="network-badge">BSC Network<br><span style="font-weight: 400; font-size: 10px;">(BEP20)</span></div>
+</div>
+</div>
+"""
+
+FOOTER_TEMPLATE = """
+<div class="main-container">
+<div class="footer-address">
+<div class="footer-address-text">{address}</div>
+</div>
+<div class="branding">
+<div class="branding-text">Powered by BSC</div>
+<div class="branding-subtext">Binance Smart Chain Network</div>
+</div>
+</div>
+"""
+
+WALLET_NOT_CONFIGURED_HTML = """
+<div class="main-container">
+<div class="error-message">
+<h3 style="margin-bottom: 12px;">Wallet Not Configured</h3>
+<p style="margin-bottom: 16px;">Please add your wallet address to the environment variables.</p>
+<p style="font-size: 12px; color: #848E9C;">Set <code>WALLET_ADDRESS</code> in your Secrets</p>
+</div>
+</div>
+"""
+
+INVALID_ADDRESS_TEMPLATE = """
+<div class="main-container">
+<div class="error-message">
+<h3 style="margin-bottom: 12px;">Invalid Wallet Address</h3>
+<p style="margin-bottom: 16px;">The wallet address provided is not valid.</p>
+<p style="font-size: 12px; color: #848E9C;">Address: <code>{address}</code></p>
+</div>
+</div>
+"""
+
+STYLESHEET = """
+<link rel="preconnect" href="https://fonts.googleapis.com">
+<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&family=Roboto+Mono:wght@400;500&display=swap');
     
@@ -260,37 +338,119 @@ st.markdown("""
         padding: 0 !important;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-@st.cache_data(ttl=30)
-def get_wallet_balances(address):
+st.markdown(STYLESHEET, unsafe_allow_html=True)
+
+def is_valid_address(address):
+    if ADDRESS_PATTERN.fullmatch(address) is None:
+        return False
+
+    # All-lowercase and all-uppercase addresses carry no checksum; a
+    # mixed-case one must be valid EIP-55. eth_utils comes with web3 but
+    # loads far faster, so it is only imported for the mixed-case case.
+    digits = address[2:]
+    if digits == digits.lower() or digits == digits.upper():
+        return True
+    from eth_utils import is_checksum_address
+    return is_checksum_address(address)
+
+@st.cache_resource
+def get_web3():
+    # web3 takes most of a second to import, so it is loaded here rather
+    # than at the top of the script; the page paints before this runs.
+    from web3 import Web3
+    
+    class BatchHTTPProvider(Web3.HTTPProvider):
+        def make_batch_request(self, batch_requests):
+            response = super().make_batch_request(batch_requests)
+            # Some nodes answer a batch they refuse with a single error object
+            # and leave out "id". web3 only accepts that as an RPC error when
+            # the id is present and null, so fill it in; is_batch_rejected
+            # then sees the error code either way.
+            if isinstance(response, dict) and "error" in response:
+                response.setdefault("id", None)
+            return response
+    
+    return Web3(BatchHTTPProvider(
+        BSC_RPC_URL,
+        request_kwargs={"timeout": RPC_TIMEOUT_SECONDS},
+    ))
+
+@st.cache_resource
+def get_rpc_executor():
+    # web3 keeps one HTTP session per thread, and Streamlit runs every script
+    # run on a new thread, so each run would open a fresh connection to the
+    # RPC node. Sending all calls from this one long-lived worker keeps a
+    # single connection alive between runs.
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="bsc-rpc")
+
+@st.cache_resource
+def get_usdt_contract():
+    # USDT_CONTRACT_ADDRESS is already in checksum form.
+    return get_web3().eth.contract(address=USDT_CONTRACT_ADDRESS, abi=USDT_ABI)
+
+def is_batch_rejected(error):
+    # A node that does not accept JSON-RPC batches either refuses the POST
+    # with an HTTP 4xx, or answers with a single error that has no id instead
+    # of a list of responses. Rate limits and errors for one of the calls in
+    # the batch are real failures and must not trigger a retry.
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is not None and 400 <= status < 500 and status != 429
+    
+    response = getattr(error, "rpc_response", None) or {}
+    if response.get("id") is not None:
+        return False
+    return response.get("error", {}).get("code") not in RATE_LIMIT_ERROR_CODES
+
+def fetch_raw_balances(w3, usdt_contract, checksum_address):
+    from web3.exceptions import Web3RPCError
+    
     try:
-        w3 = Web3(Web3.HTTPProvider(BSC_RPC_URL))
-        
-        if not w3.is_address(address):
-            return None, None, None
-        
-        checksum_address = w3.to_checksum_address(address)
-        
+        with w3.batch_requests() as batch:
+            batch.add(w3.eth.get_balance(checksum_address))
+            batch.add(usdt_contract.functions.balanceOf(checksum_address))
+            return batch.execute()
+    except (Web3RPCError, requests.HTTPError) as e:
+        # Some RPC nodes reject JSON-RPC batches outright; fall back to
+        # issuing the two calls one after the other.
+        if not is_batch_rejected(e):
+            raise
         bnb_balance_wei = w3.eth.get_balance(checksum_address)
-        bnb_balance = float(w3.from_wei(bnb_balance_wei, 'ether'))
-        
-        usdt_contract = w3.eth.contract(
-            address=w3.to_checksum_address(USDT_CONTRACT_ADDRESS),
-            abi=USDT_ABI
-        )
         usdt_balance_raw = usdt_contract.functions.balanceOf(checksum_address).call()
-        usdt_balance = float(usdt_balance_raw) / (10 ** 18)
-        
-        bnb_price = 300
-        total_usd = usdt_balance + (bnb_balance * bnb_price)
-        
-        return bnb_balance, usdt_balance, total_usd
-    except Exception as e:
-        st.error(f"Error fetching balances: {str(e)}")
-        return 0, 0, 0
+        return bnb_balance_wei, usdt_balance_raw
+
+@st.cache_data(ttl=BALANCE_TTL_SECONDS, show_spinner=False)
+def get_wallet_balances(address):
+    # The caller validates the address with is_valid_address first. Errors
+    # propagate so that a failed fetch is not cached for the whole TTL.
+    w3 = get_web3()
+    checksum_address = w3.to_checksum_address(address)
+
+    usdt_contract = get_usdt_contract()
+
+    bnb_balance_wei, usdt_balance_raw = get_rpc_executor().submit(
+        fetch_raw_balances, w3, usdt_contract, checksum_address
+    ).result()
+
+    bnb_balance = bnb_balance_wei / WEI_PER_BNB
+    usdt_balance = usdt_balance_raw / USDT_UNIT
+    
+    bnb_price = 300
+    total_usd = usdt_balance + (bnb_balance * bnb_price)
+    
+    return bnb_balance, usdt_balance, total_usd
 
+@st.cache_data(show_spinner=False)
 def generate_qr_code(data):
+    # Imported here so qrcode (and the Pillow import it triggers) is only
+    # loaded when a QR code is actually built; the result is cached.
+    from qrcode import QRCode
+    from qrcode.constants import ERROR_CORRECT_L
+    from io import BytesIO
+    import base64
+    
     qr = QRCode(
         version=1,
         error_correction=ERROR_CORRECT_L,
@@ -308,86 +468,63 @@ def generate_qr_code(data):
     
     return img_str
 
+def balance_cards_html(total_usd, bnb_balance, usdt_balance):
+    return PORTFOLIO_CARD_TEMPLATE.format(
+        username=html.escape(WALLET_USERNAME),
+        total_usd=total_usd,
+    ) + BALANCE_ROW_TEMPLATE.format(
+        bnb_balance=bnb_balance,
+        usdt_balance=usdt_balance,
+    )
+
+@st.fragment
+def render_balances(address):
+    error_slot = st.empty()
+    cards_slot = st.empty()
+    
+    # Show the last cards rendered in this session (placeholders on the
+    # first render) until the fetch below replaces them. A failed fetch
+    # leaves them in place rather than showing balances of zero.
+    if "balance_cards" not in st.session_state:
+        st.session_state.balance_cards = balance_cards_html("--", "--", "--")
+    cards_slot.markdown(st.session_state.balance_cards, unsafe_allow_html=True)
+    
+    # A click on a widget inside the fragment reruns only the fragment, so
+    # refreshing re-fetches the balances without re-sending the stylesheet,
+    # QR code and footer.
+    if st.button("Refresh balances", key="refresh_balances"):
+        get_wallet_balances.clear()
+    
+    try:
+        bnb_balance, usdt_balance, total_usd = get_wallet_balances(address)
+    except Exception as e:
+        error_slot.error(f"Error fetching balances: {str(e)}")
+        return
+    
+    st.session_state.balance_cards = balance_cards_html(
+        f"{total_usd:.2f}",
+        f"{bnb_balance:.4f}",
+        f"{usdt_balance:.2f}",
+    )
+    cards_slot.markdown(st.session_state.balance_cards, unsafe_allow_html=True)
+
 if not WALLET_ADDRESS:
-    st.markdown("""
-    <div class="main-container">
-        <div class="error-message">
-            <h3 style="margin-bottom: 12px;">Wallet Not Configured</h3>
-            <p style="margin-bottom: 16px;">Please add your wallet address to the environment variables.</p>
-            <p style="font-size: 12px; color: #848E9C;">Set <code>WALLET_ADDRESS</code> in your Secrets</p>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.html(WALLET_NOT_CONFIGURED_HTML)
 else:
-    bnb_balance, usdt_balance, total_usd = get_wallet_balances(WALLET_ADDRESS)
-    
-    if bnb_balance is None or usdt_balance is None or total_usd is None:
-        st.markdown(f"""
-        <div class="main-container">
-            <div class="error-message">
-                <h3 style="margin-bottom: 12px;">Invalid Wallet Address</h3>
-                <p style="margin-bottom: 16px;">The wallet address provided is not valid.</p>
-                <p style="font-size: 12px; color: #848E9C;">Address: <code>{WALLET_ADDRESS}</code></p>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+    if not is_valid_address(WALLET_ADDRESS):
+        st.markdown(INVALID_ADDRESS_TEMPLATE.format(address=html.escape(WALLET_ADDRESS)), unsafe_allow_html=True)
         st.stop()
     
-    qr_code_base64 = generate_qr_code(WALLET_ADDRESS)
+    # Reserve the slot above the QR section so the address and QR code paint
+    # right away; the balance cards fill in once the RPC call returns.
+    balance_area = st.container()
     
-    st.markdown(f"""
-<div class="main-container">
-<div class="portfolio-card">
-<div class="username-badge">{WALLET_USERNAME}</div>
-<div class="live-indicator"><span class="live-dot"></span>Live from BSC</div>
-<div class="portfolio-label">Total Portfolio Value</div>
-<div class="portfolio-value">${total_usd:.2f}</div>
-</div>
-</div>
-""", unsafe_allow_html=True)
-    
-    st.markdown(f"""
-<div class="main-container">
-<div class="balance-row">
-<div class="balance-card">
-<div class="balance-label">BNB BALANCE</div>
-<div class="balance-amount">{bnb_balance:.4f}</div>
-<div class="balance-token">BNB</div>
-</div>
-<div class="balance-card">
-<div class="balance-label">USDT BALANCE</div>
-<div class="balance-amount">${usdt_balance:.2f}</div>
-<div class="balance-token">USDT (BEP20)</div>
-</div>
-</div>
-</div>
-""", unsafe_allow_html=True)
+    qr_code_base64 = generate_qr_code(WALLET_ADDRESS)
     
-    st.markdown(f"""
-<div class="main-container">
-<div class="qr-section">
-<div class="qr-title">Send to this wallet</div>
-<div class="qr-subtitle">Scan QR code or copy address below</div>
-<div class="qr-container">
-<img src="data:image/png;base64,{qr_code_base64}" width="180" height="180" alt="QR Code">
-</div>
-<div class="address-section">
-<div class="address-label">WALLET ADDRESS</div>
-<div class="address-text">{WALLET_ADDRESS}</div>
-</div>
-<div class="network-badge">BSC Network<br><span style="font-weight: 400; font-size: 10px;">(BEP20)</span></div>
-</div>
-</div>
-""", unsafe_allow_html=True)
+    st.markdown(QR_SECTION_TEMPLATE.format(
+        qr_code_base64=qr_code_base64,
+        address=WALLET_ADDRESS,
+    ) + FOOTER_TEMPLATE.format(address=WALLET_ADDRESS), unsafe_allow_html=True)
     
-    st.markdown(f"""
-<div class="main-container">
-<div class="footer-address">
-<div class="footer-address-text">{WALLET_ADDRESS}</div>
-</div>
-<div class="branding">
-<div class="branding-text">Powered by BSC</div>
-<div class="branding-subtext">Binance Smart Chain Network</div>
-</div>
-</div>
-""", unsafe_allow_html=True)
+    with balance_area:
+        render_balances(WALLET_ADDRESS)